@@ -1,20 +1,73 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from msbp import MSBP
 from msbt import MSBT
-from szs import SZS
+from szs import DEFAULT_CACHE_DIR, SZS
+from util import BinaryReader, save_json
 import argparse
-import json
 import os
 import sys
 
 
+# project data and reader for the current worker process, set up by `init_worker`
+_msbp = None
+_reader = None
+
+
 def error(message: str):
     print("error: {message}", file=sys.stderr)
     sys.exit(1)
 
 
-def read_szs_file(path: str) -> SZS:
-    with open(path, "rb") as f:
-        return SZS(f.read())
+def read_szs_file(path: str, cache_dir: str | None = None) -> SZS:
+    return SZS.from_path(path, cache_dir)
+
+
+def init_worker(msbp_stream: bytes):
+    global _msbp, _reader
+    _msbp = MSBP(msbp_stream)
+    _reader = BinaryReader(b"")
+
+
+# written to each output directory once all of its JSON has been saved
+STAMP_NAME = ".converted"
+
+
+def convert_szs_file(szs_path: str, out_szs_path: str, cache_dir: str | None):
+    stamp_path = f"{out_szs_path}/{STAMP_NAME}"
+    # the directory doesn't count as converted until the new stamp is written
+    try:
+        os.remove(stamp_path)
+    except FileNotFoundError:
+        pass
+
+    szs = read_szs_file(szs_path, cache_dir)
+    out_names = []
+    for filename, data in szs.files.items():
+        msbt = MSBT(data, _msbp, _reader)
+        out_name = filename.removesuffix(".msbt") + ".json"
+        save_json(f"{out_szs_path}/{out_name}", msbt.data)
+        out_names.append(out_name)
+
+    # list every file written, so one that goes missing later is noticed
+    with open(stamp_path + ".tmp", "w") as f:
+        f.write("\n".join(out_names))
+    os.replace(stamp_path + ".tmp", stamp_path)
+
+
+def is_up_to_date(szs_path: str, out_szs_path: str, project_mtime: float) -> bool:
+    # an archive is up to date if its conversion finished after both it and
+    # the project data last changed, and none of its JSON has been removed
+    stamp_path = f"{out_szs_path}/{STAMP_NAME}"
+    try:
+        src_mtime = max(os.stat(szs_path).st_mtime, project_mtime)
+        if os.stat(stamp_path).st_mtime < src_mtime:
+            return False
+        with open(stamp_path) as f:
+            out_names = f.read().splitlines()
+    except FileNotFoundError:
+        return False
+
+    return all(os.path.isfile(f"{out_szs_path}/{name}") for name in out_names)
 
 
 def main():
@@ -22,6 +75,14 @@ def main():
     parser.add_argument("romfsdir", help="path to SMO assets")
     parser.add_argument("outdir", help="path to save JSON to")
     parser.add_argument("-q", "--quiet", action="store_true")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="where to cache decompressed SZS files")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always decompress SZS files")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="convert archives even if their JSON is up to date")
 
     args = parser.parse_args()
 
@@ -36,27 +97,46 @@ def main():
     if not os.path.isfile(f"{localized_path}/USen/MessageData/StageMessage.szs"):
         error("romfs path doesn't contain LocalizedData")
 
-    szs = read_szs_file(f"{localized_path}/Common/ProjectData.szs")
-    msbp = MSBP(szs.files["ProjectData.msbp"])
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    project_path = f"{localized_path}/Common/ProjectData.szs"
+    szs = read_szs_file(project_path, cache_dir)
+    # copied out of the archive so it can be sent to the workers
+    msbp_stream = bytes(szs.files["ProjectData.msbp"])
 
-    languages = filter(lambda k: k != "Common", os.listdir(localized_path))
+    with os.scandir(localized_path) as it:
+        languages = [entry.name for entry in it if entry.is_dir() and entry.name != "Common"]
 
+    jobs = []
     for language in languages:
-        if not args.quiet:
-            print(f"converting {language}...")
-
-        language_path = f"{localized_path}/{language}/MessageData"
-        for szs_file in os.listdir(language_path):
-            szs_path = f"{language_path}/{szs_file}"
-            out_szs_path = f"{args.outdir}/{language}/" + szs_file.removesuffix(".szs")
-            os.makedirs(out_szs_path, exist_ok=True)
-
-            szs = read_szs_file(szs_path)
-            for filename, data in szs.files.items():
-                msbt = MSBT(data, msbp)
-                out_path = f"{out_szs_path}/" + filename.removesuffix(".msbt") + ".json"
-                with open(out_path, "w") as f:
-                    json.dump(msbt.data, f, ensure_ascii=False, indent=2)
+        with os.scandir(f"{localized_path}/{language}/MessageData") as it:
+            for entry in it:
+                if not entry.name.endswith(".szs"):
+                    continue
+                out_szs_path = f"{args.outdir}/{language}/" + entry.name.removesuffix(".szs")
+                jobs.append((entry.path, out_szs_path))
+
+    if not args.force:
+        project_mtime = os.stat(project_path).st_mtime
+        jobs = [job for job in jobs if not is_up_to_date(*job, project_mtime)]
+
+    # create output directories up front so workers don't race each other
+    for _, out_szs_path in jobs:
+        os.makedirs(out_szs_path, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker,
+                             initargs=(msbp_stream,)) as executor:
+        futures = {executor.submit(convert_szs_file, *job, cache_dir): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except BaseException:
+                # stop straight away instead of converting the rest of the queue
+                executor.shutdown(cancel_futures=True)
+                raise
+            if not args.quiet:
+                szs_path, _ = futures[future]
+                print(f"converted {szs_path}")
 
     if not args.quiet:
         print("done!")
@@ -2,9 +2,8 @@
 
 import argparse
 import enum
-import json
 import sys
-from util import BinaryReader, ByteOrder, Log
+from util import BinaryReader, ByteOrder, Log, save_json
 
 class NodeType(enum.IntEnum):
     STRING = 0xA0
@@ -25,6 +24,17 @@ class NodeType(enum.IntEnum):
 OFFSET_TYPES = (NodeType.BINARY, NodeType.ARRAY, NodeType.HASH,
                 NodeType.I64, NodeType.U64, NodeType.F64)
 
+
+def node_type_name(node_type: int) -> str:
+    try:
+        return NodeType(node_type).name
+    except ValueError:
+        return f"{node_type:#04x}"
+
+
+# nonzero at the index of each node type whose value is stored at an offset
+_OFFSET_MASK = bytes(node_type in OFFSET_TYPES for node_type in range(256))
+
 class Header:
     def __init__(self, reader: BinaryReader):
         signature = reader.read_bytes(2)
@@ -42,6 +52,28 @@ class BYML:
         header = Header(self.reader)
         self.cur_node = []
 
+        # node readers indexed by node type
+        self._dispatch = [None] * 256
+        self._dispatch[NodeType.STRING] = self.read_string_node
+        self._dispatch[NodeType.BINARY] = self.read_binary_node
+        self._dispatch[NodeType.ARRAY] = self.read_array_node
+        self._dispatch[NodeType.HASH] = self.read_hash_node
+        self._dispatch[NodeType.BOOL] = self.read_bool_node
+        self._dispatch[NodeType.I32] = self.reader.read_s32
+        self._dispatch[NodeType.F32] = self.reader.read_f32
+        self._dispatch[NodeType.U32] = self.reader.read_u32
+        self._dispatch[NodeType.I64] = self.reader.read_s64
+        self._dispatch[NodeType.U64] = self.reader.read_u64
+        self._dispatch[NodeType.F64] = self.reader.read_f64
+        self._dispatch[NodeType.NULL] = self.read_null_node
+
+        # readers for arrays whose entries are all the same inline number type
+        self._array_readers = {
+            NodeType.I32: self.reader.read_s32s,
+            NodeType.F32: self.reader.read_f32s,
+            NodeType.U32: self.reader.read_u32s,
+        }
+
         self.hash_key_table = self.read_string_table(header.hash_key_table_offset)
         self.string_table = self.read_string_table(header.string_table_offset)
         self.root = self.read_root(header.root_offset)
@@ -68,17 +100,24 @@ class BYML:
             return None
 
         self.reader.seek(start)
-        node_type = NodeType(self.reader.read_u8())
+        node_type = self.reader.read_u8()
         if node_type != NodeType.STRING_TABLE:
-            Log.error(f"expected {NodeType.STRING_TABLE.name}, got {node_type.name}")
+            Log.error(f"expected {NodeType.STRING_TABLE.name}, got {node_type_name(node_type)}")
 
         string_count = self.reader.read_u24()
-        offsets = self.reader.read_u32s(string_count)
+        # the last offset points to the end of the last string
+        offsets = self.reader.read_u32s(string_count + 1)
+
+        # strings are stored back to back, so read them all in one go
+        base = offsets[0]
+        self.reader.seek(start + base)
+        data = self.reader.read(offsets[-1] - base)
 
         strings = []
-        for offset in offsets:
-            self.reader.seek(start + offset)
-            strings.append(self.reader.read_string("utf-8"))
+        for offset in offsets[:-1]:
+            pos = offset - base
+            end = data.index(b"\x00", pos)
+            strings.append(data[pos:end].decode("utf-8"))
 
         return strings
 
@@ -89,14 +128,14 @@ class BYML:
         self.cur_node.append("root")
 
         self.reader.seek(start)
-        node_type = NodeType(self.reader.read_u8())
+        node_type = self.reader.read_u8()
         self.reader.seek(-1, relative=True)
 
         ctor = {NodeType.ARRAY: self.read_array_node,
                 NodeType.HASH: self.read_hash_node}.get(node_type)
         
         if ctor is None:
-            Log.error(f"invalid root node type ({node_type.name})")
+            Log.error(f"invalid root node type ({node_type_name(node_type)})")
 
         root = ctor()
         self.cur_node.pop()
@@ -111,16 +150,21 @@ class BYML:
         return self.reader.read_bytes(length)
 
     def read_array_node(self) -> list:
-        node_type = NodeType(self.reader.read_u8())
+        node_type = self.reader.read_u8()
         if not self.quiet and node_type != NodeType.ARRAY:
             cur_node = self.get_cur_node()
-            Log.info(f"hash node type is {node_type.name}, should be ARRAY ({cur_node})")
+            Log.info(f"hash node type is {node_type_name(node_type)}, should be ARRAY ({cur_node})")
 
         entry_count = self.reader.read_u24()
-        entry_types = [NodeType(t) for t in self.reader.read_u8s(entry_count)]
+        entry_types = self.reader.read_u8s(entry_count)
         self.reader.align(4)
         entries_start = self.reader.position
-        
+
+        if entry_count and len(set(entry_types)) == 1:
+            array_reader = self._array_readers.get(entry_types[0])
+            if array_reader is not None:
+                return array_reader(entry_count)
+
         entries = []
         for i, entry_type in enumerate(entry_types):
             self.cur_node.append(i)
@@ -131,10 +175,10 @@ class BYML:
         return entries
 
     def read_hash_node(self) -> dict:
-        node_type = NodeType(self.reader.read_u8())
+        node_type = self.reader.read_u8()
         if not self.quiet and node_type != NodeType.HASH:
             cur_node = self.get_cur_node()
-            Log.info(f"hash node type is {node_type.name}, should be HASH ({cur_node})")
+            Log.info(f"hash node type is {node_type_name(node_type)}, should be HASH ({cur_node})")
 
         entry_count = self.reader.read_u24()
         entries_start = self.reader.position
@@ -145,7 +189,7 @@ class BYML:
             name = self.get_string(name_idx, is_hash_key=True)
 
             self.cur_node.append(name)
-            entry_type = NodeType(self.reader.read_u8())
+            entry_type = self.reader.read_u8()
             hash[name] = self.read_container_entry(entry_type)
             self.cur_node.pop()
 
@@ -167,25 +211,15 @@ class BYML:
             Log.info(f"null node value is {value}, should be 0 ({cur_node})")
         return None
 
-    def read_container_entry(self, entry_type: NodeType):
-        if entry_type in OFFSET_TYPES:
+    def read_container_entry(self, entry_type: int):
+        if _OFFSET_MASK[entry_type]:
             offset = self.reader.read_u32()
             self.reader.seek(offset)
 
-        ctor = {
-            NodeType.STRING: self.read_string_node,
-            NodeType.BINARY: self.read_binary_node,
-            NodeType.ARRAY: self.read_array_node,
-            NodeType.HASH: self.read_hash_node,
-            NodeType.BOOL: self.read_bool_node,
-            NodeType.I32: self.reader.read_s32,
-            NodeType.F32: self.reader.read_f32,
-            NodeType.U32: self.reader.read_u32,
-            NodeType.I64: self.reader.read_s64,
-            NodeType.U64: self.reader.read_u64,
-            NodeType.F64: self.reader.read_f64,
-            NodeType.NULL: self.read_null_node,
-        }[entry_type]
+        ctor = self._dispatch[entry_type]
+        if ctor is None:
+            cur_node = self.get_cur_node()
+            Log.error(f"invalid container entry type ({node_type_name(entry_type)}) ({cur_node})")
 
         return ctor()
 
@@ -201,8 +235,7 @@ def main():
     with open(args.infile, "rb") as f:
         byml = BYML(f.read(), quiet=args.quiet)
 
-    with open(args.outfile, "w") as f:
-        json.dump(byml.root, f, indent=2, ensure_ascii=False)
+    save_json(args.outfile, byml.root)
 
 if __name__ == "__main__":
     main()
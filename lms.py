@@ -1,4 +1,5 @@
 import enum
+import operator
 from util import BinaryReader
 
 
@@ -18,6 +19,14 @@ class ParamType(enum.IntEnum):
     NULL = 9
 
 
+# character size and codec name for each encoding
+ENCODINGS = {
+    Encoding.UTF8: (1, "utf-8"),
+    Encoding.UTF16: (2, "utf-16"),
+    Encoding.UTF32: (4, "utf-32"),
+}
+
+
 class Header:
     def __init__(self, reader: BinaryReader, signature: str):
         reader.read_signature(8, signature)
@@ -34,15 +43,22 @@ class Header:
 class Block:
     def __init__(self, _: BinaryReader, encoding: Encoding):
         self.encoding = encoding
+        self.char_size, self.encoding_name = ENCODINGS[encoding]
 
     def read_encoded_string(self, reader: BinaryReader, size: int = -1) -> str:
-        char_size, encoding_name = {
-            Encoding.UTF8: (1, "utf-8"),
-            Encoding.UTF16: (2, "utf-16"),
-            Encoding.UTF32: (4, "utf-32"),
-        }[self.encoding]
+        return reader.read_string(self.encoding_name, size, self.char_size)
+
+    def read_offset_table(self, reader: BinaryReader, count_size: int = 4) -> list[int]:
+        # a count (u32, or u16 + padding) followed by offsets relative to the
+        # start of the table. returns absolute offsets
+        start = reader.position
+        if count_size == 4:
+            count = reader.read_u32()
+        else:
+            count = reader.read_u16()
+            reader.read_u16() # padding
 
-        return reader.read_string(encoding_name, size, char_size)
+        return [start + offset for offset in reader.read_u32s(count)]
 
 
 class LabelBlock(Block):
@@ -64,11 +80,12 @@ class LabelBlock(Block):
         group_count = reader.read_u32()
         groups = [self.Group(reader) for _ in range(group_count)]
 
-        self.labels = []
+        self.labels = [None] * sum(group.label_count for group in groups)
+        i = 0
         for group in groups:
             reader.seek(start + group.offset)
             for _ in range(group.label_count):
-                label = self.Label(reader)
-                self.labels.append(label)
+                self.labels[i] = self.Label(reader)
+                i += 1
 
-        self.labels.sort(key=lambda k: k.idx)
+        self.labels.sort(key=operator.attrgetter("idx"))
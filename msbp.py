@@ -1,20 +1,16 @@
 # https://github.com/kinnay/Nintendo-File-Formats/wiki/MSBP-File-Format
 
 import argparse
-import json
 import lms
-from util import BinaryReader, Log
+from util import BinaryReader, Log, save_json
 
 
 class CLR1(lms.Block):
     def __init__(self, reader: BinaryReader, encoding: lms.Encoding):
         super().__init__(reader, encoding)
         color_count = reader.read_u32()
-        self.colors = []
-        for _ in range(color_count):
-            color = tuple(reader.read_u8() for _ in range(4))
-            color = "0x" + "".join(f"{c:02x}" for c in color)
-            self.colors.append(color)
+        raw = reader.read(4 * color_count)
+        self.colors = ["0x" + raw[i:i+4].hex() for i in range(0, len(raw), 4)]
 
 
 class ATI2(lms.Block):
@@ -37,12 +33,9 @@ class ALI2(lms.Block):
         super().__init__(reader, encoding)
         start = reader.position
 
-        list_count = reader.read_u32()
-        offsets = reader.read_u32s(list_count)
-
         self.attr_lists = []
-        for offset in offsets:
-            reader.seek(start + offset)
+        for offset in self.read_offset_table(reader):
+            reader.seek(offset)
             attr_list = []
             item_count = reader.read_u32()
             name_offsets = reader.read_u32s(item_count)
@@ -56,15 +49,9 @@ class ALI2(lms.Block):
 class TGG2(lms.Block):
     def __init__(self, reader: BinaryReader, encoding: lms.Encoding):
         super().__init__(reader, encoding)
-        start = reader.position
-
-        group_count = reader.read_u16()
-        reader.read_u16() # padding
-        offsets = reader.read_u32s(group_count)
-
         self.groups = []
-        for offset in offsets:
-            reader.seek(start + offset)
+        for offset in self.read_offset_table(reader, count_size=2):
+            reader.seek(offset)
             group_idx = reader.read_u16()
             tag_count = reader.read_u16()
             tag_indices = reader.read_u16s(tag_count)
@@ -75,15 +62,9 @@ class TGG2(lms.Block):
 class TAG2(lms.Block):
     def __init__(self, reader: BinaryReader, encoding: lms.Encoding):
         super().__init__(reader, encoding)
-        start = reader.position
-
-        tag_count = reader.read_u16()
-        reader.read_u16() # padding
-        offsets = reader.read_u32s(tag_count)
-
         self.tags = []
-        for offset in offsets:
-            reader.seek(start + offset)
+        for offset in self.read_offset_table(reader, count_size=2):
+            reader.seek(offset)
             param_count = reader.read_u16()
             params = reader.read_u16s(param_count)
             tag_name = self.read_encoded_string(reader)
@@ -93,15 +74,9 @@ class TAG2(lms.Block):
 class TGP2(lms.Block):
     def __init__(self, reader: BinaryReader, encoding: lms.Encoding):
         super().__init__(reader, encoding)
-        start = reader.position
-
-        param_count = reader.read_u16()
-        reader.read_u16() # padding
-        offsets = reader.read_u32s(param_count)
-
         self.params = []
-        for offset in offsets:
-            reader.seek(start + offset)
+        for offset in self.read_offset_table(reader, count_size=2):
+            reader.seek(offset)
             param_type = reader.read_u8()
             if param_type == lms.ParamType.NULL:
                 reader.read_u8() # padding
@@ -117,15 +92,9 @@ class TGP2(lms.Block):
 class TGL2(lms.Block):
     def __init__(self, reader: BinaryReader, encoding: lms.Encoding):
         super().__init__(reader, encoding)
-        start = reader.position
-
-        item_count = reader.read_u16()
-        reader.read_u16() # padding
-        offsets = reader.read_u32s(item_count)
-
         self.items = []
-        for offset in offsets:
-            reader.seek(start + offset)
+        for offset in self.read_offset_table(reader, count_size=2):
+            reader.seek(offset)
             item_name = self.read_encoded_string(reader)
             self.items.append(item_name)
 
@@ -147,14 +116,9 @@ class SYL3(lms.Block):
 class CTI1(lms.Block):
     def __init__(self, reader: BinaryReader, encoding: lms.Encoding):
         super().__init__(reader, encoding)
-        start = reader.position
-
-        filename_count = reader.read_u32()
-        offsets = reader.read_u32s(filename_count)
-
         self.filenames = []
-        for offset in offsets:
-            reader.seek(start + offset)
+        for offset in self.read_offset_table(reader):
+            reader.seek(offset)
             self.filenames.append(self.read_encoded_string(reader))
 
 
@@ -221,6 +185,8 @@ class MSBP:
                     group["tags"].append(tag)
                 self.data["tags"][group_idx] = group
 
+            self._apply_msbt_overrides()
+
         # styles
         style_blocks = ("SYL3", "SLB1")
         if all(block in self.blocks for block in style_blocks):
@@ -234,6 +200,17 @@ class MSBP:
             self.data["filenames"] = self.blocks["CTI1"].filenames
 
 
+    def _apply_msbt_overrides(self):
+        # the project data doesn't describe the parameters of these system tags
+        tags = self.data["tags"]
+        tags[0]["tags"][0]["params"] = [
+            {"name": "replace", "type": lms.ParamType.U16},
+            {"name": "rt", "type": lms.ParamType.STRING}
+        ]
+        tags[0]["tags"][2]["params"] = [{"name": "percent", "type": lms.ParamType.U16}]
+        tags[0]["tags"][3]["params"] = [{"name": "index", "type": lms.ParamType.I16}]
+
+
 def main():
     parser = argparse.ArgumentParser(description="read MSBP project files")
     parser.add_argument("infile")
@@ -245,8 +222,7 @@ def main():
     with open(args.infile, "rb") as f:
         msbp = MSBP(f.read())
 
-    with open(args.outfile, "w") as f:
-        json.dump(msbp.data, f, ensure_ascii=False, indent=2)
+    save_json(args.outfile, msbp.data)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,20 @@
 # https://github.com/kinnay/Nintendo-File-Formats/wiki/MSBT-File-Format
 
 import argparse
-import json
+import functools
 import lms
+import re
 from msbp import MSBP
-from util import BinaryReader, Log
+from util import BinaryReader, Log, save_json
+
+
+@functools.lru_cache
+def boundary_pattern(char_size: int, byte_order: str) -> re.Pattern:
+    # a null terminator or tag code unit. this can also match across two
+    # code units, so the alignment of each match has to be checked
+    null = re.escape((0).to_bytes(char_size, byte_order))
+    tag = re.escape((0x0e).to_bytes(char_size, byte_order))
+    return re.compile(null + b"|" + tag)
 
 
 class LBL1(lms.LabelBlock):
@@ -13,73 +23,88 @@ class LBL1(lms.LabelBlock):
 
 
 class TXT2(lms.Block):
+    param_readers = {
+        lms.ParamType.U8: BinaryReader.read_u8,
+        lms.ParamType.U16: BinaryReader.read_u16,
+        lms.ParamType.I16: BinaryReader.read_s16,
+        lms.ParamType.U32: BinaryReader.read_u32,
+        lms.ParamType.F32: BinaryReader.read_f32,
+    }
+
     def __init__(self, reader: BinaryReader, encoding: lms.Encoding, project_data: MSBP):
         super().__init__(reader, encoding)
-        start = reader.position
-
         tags = project_data.data["tags"]
-        tags[0]["tags"][0]["params"] = [
-            {"name": "replace", "type": lms.ParamType.U16},
-            {"name": "rt", "type": lms.ParamType.STRING}
-        ]
-        tags[0]["tags"][2]["params"] = [{"name": "percent", "type": lms.ParamType.U16}]
-        tags[0]["tags"][3]["params"] = [{"name": "index", "type": lms.ParamType.I16}]
-
-        message_count = reader.read_u32()
-        offsets = reader.read_u32s(message_count)
 
         self.messages = []
-        for offset in offsets:
-            reader.seek(start + offset)
+        for offset in self.read_offset_table(reader):
+            reader.seek(offset)
             message = self.read_tag_string(reader, tags)
             self.messages.append(message)
 
     def read_tag_string(self, reader: BinaryReader, tags: dict) -> str:
-        char_size, encoding_name = {
-            lms.Encoding.UTF8: (1, "utf-8"),
-            lms.Encoding.UTF16: (2, "utf-16"),
-            lms.Encoding.UTF32: (4, "utf-32")
-        }[self.encoding]
-
-        out = ""
-        while (char := reader.read(char_size).decode(encoding_name)) != '\x00':
-            if char == '\x0e':
-                group_idx = reader.read_u16()
-                type_idx = reader.read_u16()
-                tag_group = tags[group_idx]
-                tag = tag_group["tags"][type_idx]
-
-                param_count = reader.read_u16()
-                params = []
-                for param in tag["params"]:
-                    params.append((param["name"], {
-                        0: reader.read_u8,
-                        1: reader.read_u16,
-                        2: reader.read_s16,
-                        5: reader.read_u32,
-                        6: reader.read_f32,
-                        8: lambda: self.read_encoded_string(reader, reader.read_u16()),
-                        9: lambda: None,
-                    }[param["type"]](), param["type"]))
-                
-                out_parts = [tag_group["name"], tag["name"]]
-                if param_count > 0:
-                    out_params = []
-                    for name, val, type_ in params:
-                        formatted_val = f"'{val}'" if type_ == 8 else f"{val}"
-                        out_params.append(f"{name}: {formatted_val}")
-                    out_parts.append("(" + ", ".join(out_params) + ")")
-                    
-                out += "<" + ", ".join(out_parts) + ">"
-            else:
-                out += char
-
-        return out
+        char_size = self.char_size
+        encoding_name = self.encoding_name
+
+        pattern = boundary_pattern(char_size, reader.byte_order.name)
+        null = (0).to_bytes(char_size, reader.byte_order.name)
+
+        out = []
+        while True:
+            # find the next aligned tag or null terminator
+            start = search_pos = reader.position
+            while True:
+                match = pattern.search(reader.stream, search_pos)
+                if match is None:
+                    raise OSError("EOF reached")
+                if (match.start() - start) % char_size == 0:
+                    break
+                search_pos = match.start() + 1
+
+            # decode all text up to it at once
+            text = reader.read(match.start() - start)
+            if text:
+                out.append(text.decode(encoding_name))
+
+            if reader.read(char_size) == null:
+                break
+
+            group_idx = reader.read_u16()
+            type_idx = reader.read_u16()
+            tag_group = tags[group_idx]
+            tag = tag_group["tags"][type_idx]
+
+            param_count = reader.read_u16()
+            params = []
+            for param in tag["params"]:
+                param_type = param["type"]
+                if param_type == lms.ParamType.STRING:
+                    val = self.read_encoded_string(reader, reader.read_u16())
+                elif param_type == lms.ParamType.NULL:
+                    val = None
+                else:
+                    val = self.param_readers[param_type](reader)
+                params.append((param["name"], val, param_type))
+
+            out_parts = [tag_group["name"], tag["name"]]
+            if param_count > 0:
+                out_params = []
+                for name, val, type_ in params:
+                    formatted_val = f"'{val}'" if type_ == 8 else f"{val}"
+                    out_params.append(f"{name}: {formatted_val}")
+                out_parts.append("(" + ", ".join(out_params) + ")")
+
+            out.append("<" + ", ".join(out_parts) + ">")
+
+        return "".join(out)
 
 
 class MSBT:
-    def __init__(self, stream: bytes, project_data: MSBP):
-        reader = BinaryReader(stream)
+    def __init__(self, stream: bytes, project_data: MSBP, reader: BinaryReader | None = None):
+        if reader is None:
+            reader = BinaryReader(stream)
+        else:
+            reader.reset(stream)
+
         header = lms.Header(reader, "MsgStdBn")
         ctors = {"LBL1": LBL1, "TXT2": TXT2}
 
@@ -122,8 +147,7 @@ def main():
     with open(args.infile, "rb") as f:
         msbt = MSBT(f.read(), project_data)
 
-    with open(args.outfile, "w") as f:
-        json.dump(msbt.data, f, ensure_ascii=False, indent=2)
+    save_json(args.outfile, msbt.data)
 
 if __name__ == "__main__":
     main()
@@ -5,6 +5,13 @@ import os
 from util import BinaryReader, Log
 
 
+def hash_filename(filename: str, key: int) -> int:
+    h = 0
+    for byte in filename.encode("utf-8"):
+        h = (h * key + byte) & 0xFFFFFFFF
+    return h
+
+
 class Header:
     def __init__(self, reader: BinaryReader):
         reader.read_signature(4, "SARC")
@@ -29,7 +36,7 @@ class SFAT:
         reader.read_signature(4, "SFAT")
         assert reader.read_u16() == 0xc, "SFAT entries offset"
         self.file_count = reader.read_u16()
-        hash_key = reader.read_u32()
+        self.hash_key = reader.read_u32()
 
         self.files = [self.Entry(reader) for _ in range(self.file_count)]
 
@@ -50,18 +57,22 @@ class SFNT:
 class SARC:
     def __init__(self, stream: bytes):
         reader = BinaryReader(stream)
+        view = memoryview(stream)
         header = Header(reader)
         sfat = SFAT(reader)
         sfnt = SFNT(reader, sfat.file_count)
 
         self.files = {}
         for file, filename in zip(sfat.files, sfnt.filenames):
+            assert hash_filename(filename, sfat.hash_key) == file.filename_hash, \
+                f"SFAT hash mismatch for {filename}"
             start = header.data_offset + file.start_offset
-            length = file.end_offset - file.start_offset
-            reader.seek(start)
-            file_data = reader.read(length)
+            end = header.data_offset + file.end_offset
+            if end > len(view):
+                raise OSError("EOF reached")
 
-            self.files[filename] = file_data
+            # files are views into the archive rather than copies
+            self.files[filename] = view[start:end]
 
     def save(self, outdir: str, quiet: bool = True):
         os.mkdir(outdir)
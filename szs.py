@@ -1,13 +1,76 @@
 import argparse
+import hashlib
+import mmap
+import os
+import tempfile
 import yaz0
 from sarc import SARC
+from util import Log
+
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "smo-file-formats", "yaz0")
+
+
+def decompress(stream: bytes) -> bytearray:
+    # decompress into a buffer SARC can take views of, avoiding yaz0's final copy
+    out = bytearray(yaz0.get_uncompressed_size(stream))
+    return yaz0.decompress(stream, out)
+
+
+def decompress_cached(stream: bytes, cache_dir: str) -> bytes | bytearray | mmap.mmap:
+    # key on the whole compressed file; hashing is far cheaper than decompressing
+    key = hashlib.blake2b(stream, digest_size=16).hexdigest()
+    path = os.path.join(cache_dir, key + ".bin")
+
+    uncompressed_size = yaz0.get_uncompressed_size(stream)
+
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            cached_size = os.fstat(f.fileno()).st_size
+            # an entry of the wrong size is stale or corrupt; treat it as a miss
+            if cached_size == uncompressed_size:
+                if cached_size == 0:
+                    return b""
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    uncompressed = decompress(stream)
+    if len(uncompressed) != uncompressed_size:
+        Log.error(f"decompressed {len(uncompressed)} bytes, expected {uncompressed_size}")
+
+    # write to a temporary file first so other processes never see a partial entry
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(uncompressed)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return uncompressed
 
 
 class SZS:
-    def __init__(self, stream: bytes):
-        uncompressed = yaz0.decompress(stream)
+    def __init__(self, stream: bytes, cache_dir: str | None = None):
+        if cache_dir is None:
+            uncompressed = decompress(stream)
+        else:
+            uncompressed = decompress_cached(stream, cache_dir)
         self._sarc = SARC(uncompressed)
 
+    @classmethod
+    def from_path(cls, path: str, cache_dir: str | None = None):
+        # map the compressed file instead of reading it into memory
+        with open(path, "rb") as f:
+            # empty files can't be mapped; let the Yaz0 header check reject them
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(b"", cache_dir)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as stream:
+                return cls(stream, cache_dir)
+
     def save(self, outdir: str, quiet: bool = True):
         self._sarc.save(outdir, quiet=quiet)
 
@@ -24,8 +87,7 @@ def main():
 
     args = parser.parse_args()
 
-    with open(args.infile, "rb") as f:
-        szs = SZS(f.read())
+    szs = SZS.from_path(args.infile)
 
     szs.save(args.outdir, quiet=args.quiet)
 
@@ -1,8 +1,18 @@
+import array
 import enum
+import functools
+import json
+import math
+import re
 import struct
 import sys
 import typing
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class Log:
     @staticmethod
@@ -15,20 +25,65 @@ class Log:
         print(f"info: {message}")
 
 
+def save_json(filename: str, obj: typing.Any):
+    # orjson is much faster for large outputs, but optional
+    if orjson is not None:
+        with open(filename, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(filename, "w") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+
+
 class ByteOrder(enum.Enum):
     little = "<"
     big = ">"
 
 
+# precompiled structs for each byte order, keyed by format character. shared
+# by BinaryReader and BinaryWriter
+_STRUCTS = {
+    byte_order: {fmt: struct.Struct(byte_order.value + fmt) for fmt in "?bBhHiIqQefd"}
+    for byte_order in ByteOrder
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _array_struct(fmt: str) -> struct.Struct:
+    return struct.Struct(fmt)
+
+
+@functools.lru_cache
+def _null_pattern(char_size: int) -> re.Pattern:
+    return re.compile(b"\x00" * char_size)
+
+
 class BinaryReader:
+    # `stream` can be any object supporting the buffer protocol (bytes, mmap,
+    # memoryview...); reads always return bytes
+
     def __init__(self, stream: bytes, byte_order: ByteOrder = ByteOrder.little):
+        self.reset(stream, byte_order)
+
+    def reset(self, stream: bytes, byte_order: ByteOrder = ByteOrder.little):
+        # start reading a new stream, as if the reader had just been created
         self.stream = stream
+        self._mv = memoryview(stream).toreadonly()
         self.byte_order = byte_order
         self._position = 0
 
     @property
     def position(self) -> int:
         return self._position
+
+    @property
+    def byte_order(self) -> ByteOrder:
+        return self._byte_order
+
+    @byte_order.setter
+    def byte_order(self, byte_order: ByteOrder):
+        self._byte_order = byte_order
+        self._structs = _STRUCTS[byte_order]
     
     def seek(self, offset: int, *, relative: bool = False):
         if relative:
@@ -36,133 +91,189 @@ class BinaryReader:
         else:
             self._position = offset
 
-    @staticmethod
-    def _check_len(buffer: bytes, size: int):
-        if len(buffer) != size:
+    def _check_len(self, size: int):
+        if size > len(self._mv) - self._position:
             raise OSError("EOF reached")
-    
+
+    def read_view(self, size: int) -> memoryview:
+        # like read(), but returns a view into the stream instead of a copy
+        self._check_len(size)
+        out = self._mv[self._position:self._position+size]
+        self._position += size
+        return out
+
     def read(self, size: int = -1, suppress: bool = False) -> bytes:
         if size == -1:
-            out = self.stream[self._position:]
-            self._position += len(out)
-            return out
-        
-        out = self.stream[self._position:self._position+size]
+            size = len(self._mv) - self._position
+        elif not suppress:
+            self._check_len(size)
+
+        out = bytes(self._mv[self._position:self._position+size])
         self._position += size
-        
-        if not suppress:
-            self._check_len(out, size)
         return out
-    
-    def _read(self, size: int, fmt: str, type_: type) -> typing.Any:
-        out = self.read(size)
-        endianness = self.byte_order.value
-        return type_(*struct.unpack(endianness + fmt, out))
+
+    def _read(self, size: int, fmt: str) -> typing.Any:
+        try:
+            value, = self._structs[fmt].unpack_from(self._mv, self._position)
+        except struct.error:
+            raise OSError("EOF reached")
+        self._position += size
+        return value
+
+    def _read_many(self, fmt: str, count: int) -> list:
+        s = _array_struct(f"{self.byte_order.value}{count}{fmt}")
+        try:
+            values = s.unpack_from(self._mv, self._position)
+        except struct.error:
+            raise OSError("EOF reached")
+        self._position += s.size
+        return list(values)
 
     def peek(self, size: int = 1) -> bytes:
-        offset = self.position
-        out = self.read(size)
-        self.seek(offset)
-        return out
+        self._check_len(size)
+        return bytes(self._mv[self._position:self._position+size])
     
     def read_bool(self) -> bool:
-        out = self.read(1)
-        if out == b'\x00':
-            return False
-        else:
-            return True
+        return self._read(1, "B") != 0
         
     def read_s8(self) -> int:
-        return self._read(1, "b", int)
+        return self._read(1, "b")
 
     def read_u8(self) -> int:
-        return self._read(1, "B", int)
+        return self._read(1, "B")
         
     def read_s16(self) -> int:
-        return self._read(2, "h", int)
+        return self._read(2, "h")
 
     def read_u16(self) -> int:
-        return self._read(2, "H", int)
+        return self._read(2, "H")
     
     def read_u24(self) -> int:
-        out = self.read(3)
-        if self.byte_order == ByteOrder.little:
-            return struct.unpack("<I", out + b'\x00')[0]
-        else:
-            return struct.unpack(">I", b'\x00' + out)[0]
+        return int.from_bytes(self.read_view(3), self.byte_order.name)
         
     def read_s32(self) -> int:
-        return self._read(4, "i", int)
+        return self._read(4, "i")
 
     def read_u32(self) -> int:
-        return self._read(4, "I", int)
+        return self._read(4, "I")
         
     def read_s64(self) -> int:
-        return self._read(8, "q", int)
+        return self._read(8, "q")
 
     def read_u64(self) -> int:
-        return self._read(8, "Q", int)
+        return self._read(8, "Q")
         
     def read_bytes(self, size: int) -> bytes:
         return self.read(size)
     
     def read_f16(self) -> float:
-        return self._read(2, "s", float)
+        return self._read(2, "e")
         
     def read_f32(self) -> float:
-        return self._read(4, "f", float)
+        return self._read(4, "f")
     
     def read_f64(self) -> float:
-        return self._read(8, "d", float)
+        return self._read(8, "d")
     
     def read_bools(self, count: int) -> list[bool]:
-        return [self.read_bool() for _ in range(count)]
+        return [byte != 0 for byte in self.read(count)]
         
     def read_s8s(self, count: int) -> list[int]:
-        return [self.read_s8() for _ in range(count)]
+        return self._read_many("b", count)
 
     def read_u8s(self, count: int) -> list[int]:
-        return [self.read_u8() for _ in range(count)]
+        return self._read_many("B", count)
         
     def read_s16s(self, count: int) -> list[int]:
-        return [self.read_s16() for _ in range(count)]
+        return self._read_many("h", count)
 
     def read_u16s(self, count: int) -> list[int]:
-        return [self.read_u16() for _ in range(count)]
+        return self._read_many("H", count)
         
     def read_s32s(self, count: int) -> list[int]:
-        return [self.read_s32() for _ in range(count)]
+        return self._read_many("i", count)
 
     def read_u32s(self, count: int) -> list[int]:
-        return [self.read_u32() for _ in range(count)]
+        return self._read_many("I", count)
         
     def read_s64s(self, count: int) -> list[int]:
-        return [self.read_s64() for _ in range(count)]
+        return self._read_many("q", count)
 
     def read_u64s(self, count: int) -> list[int]:
-        return [self.read_u64() for _ in range(count)]
+        return self._read_many("Q", count)
 
     def read_f16s(self, count: int) -> list[float]:
-        return [self.read_f16() for _ in range(count)]
+        return self._read_many("e", count)
 
     def read_f32s(self, count: int) -> list[float]:
-        return [self.read_f32() for _ in range(count)]
+        return self._read_many("f", count)
 
     def read_f64s(self, count: int) -> list[float]:
-        return [self.read_f64() for _ in range(count)]
+        return self._read_many("d", count)
+
+    def read_array(self, typecode: str, count: int) -> array.array:
+        # like the read_*s methods, but packed into an array.array instead of
+        # a list of Python objects. typecodes are the struct ones (b, B, h, H...)
+        out = array.array(typecode)
+        out.frombytes(self.read_view(out.itemsize * count))
+
+        if self.byte_order.name != sys.byteorder:
+            out.byteswap()
+        return out
+
+    def read_s8_array(self, count: int) -> array.array:
+        return self.read_array("b", count)
+
+    def read_u8_array(self, count: int) -> array.array:
+        return self.read_array("B", count)
+
+    def read_s16_array(self, count: int) -> array.array:
+        return self.read_array("h", count)
+
+    def read_u16_array(self, count: int) -> array.array:
+        return self.read_array("H", count)
+
+    def read_s32_array(self, count: int) -> array.array:
+        return self.read_array("i", count)
+
+    def read_u32_array(self, count: int) -> array.array:
+        return self.read_array("I", count)
+
+    def read_s64_array(self, count: int) -> array.array:
+        return self.read_array("q", count)
+
+    def read_u64_array(self, count: int) -> array.array:
+        return self.read_array("Q", count)
+
+    def read_f32_array(self, count: int) -> array.array:
+        return self.read_array("f", count)
+
+    def read_f64_array(self, count: int) -> array.array:
+        return self.read_array("d", count)
 
     def read_string(self, encoding_name: str, size: int = -1, char_size: int = 1) -> str:
         if size == -1:
-            out = b""
-            while (char := self.read(char_size)) != b'\x00':
-                out += char
+            # search for the null terminator, skipping matches that don't
+            # start on a character boundary
+            pattern = _null_pattern(char_size)
+            start = self._position
+            match = pattern.search(self._mv, start)
+            while match and (match.start() - start) % char_size:
+                match = pattern.search(self._mv, match.start() + 1)
+            if match is None:
+                raise OSError("EOF reached")
+
+            out = bytes(self._mv[start:match.start()])
+            self._position = match.end()
         else:
             out = self.read(size, suppress=True)
-            # cut string off early at null terminator
-            chars = [out[i:i+char_size] for i in range(0, size, char_size)]
-            for i, char in enumerate(chars):
-                if not int.from_bytes(char, self.byte_order.name):
-                    out = out[:i]
+            # cut string off early at the first null character
+            null = b'\x00' * char_size
+            end = out.find(null)
+            while end > 0 and end % char_size:
+                end = out.find(null, end + 1)
+            if end >= 0:
+                out = out[:end]
         
         return out.decode(encoding_name)
     
@@ -186,9 +297,7 @@ class BinaryReader:
         return self.byte_order
     
     def align(self, alignment: int):
-        pos = self.position
-        delta = (-pos % alignment + alignment) % alignment
-        self.seek(delta, relative=True)
+        self._position += -self._position % alignment
 
 
 class BinaryWriter:
@@ -201,6 +310,15 @@ class BinaryWriter:
     def position(self) -> int:
         return self._position
 
+    @property
+    def byte_order(self) -> ByteOrder:
+        return self._byte_order
+
+    @byte_order.setter
+    def byte_order(self, byte_order: ByteOrder):
+        self._byte_order = byte_order
+        self._structs = _STRUCTS[byte_order]
+
     def save(self, filename: str):
         with open(filename, "wb") as f:
             f.write(self.stream)
@@ -210,13 +328,17 @@ class BinaryWriter:
             self._position += offset
         else:
             self._position = offset
-        
-        self._fill_bytes(0)
+
+        if self._position > len(self.stream):
+            self._fill_bytes(0)
 
     def align(self, alignment: int):
-        pos = self.position
-        delta = (-pos % alignment + alignment) % alignment
-        self.seek(delta, relative=True)
+        delta = -self._position % alignment
+        if self._position == len(self.stream):
+            self.stream.extend(bytes(delta))
+            self._position += delta
+        else:
+            self.seek(delta, relative=True)
 
     def _fill_bytes(self, offset: int, relative: bool = True):
         bytes_to_add = offset - len(self.stream)
@@ -224,18 +346,20 @@ class BinaryWriter:
             bytes_to_add += self.position
 
         if bytes_to_add > 0:
-            self.stream += bytearray(bytes_to_add)
+            self.stream.extend(bytes(bytes_to_add))
 
     def write(self, raw: bytes):
-        self._fill_bytes(len(raw))
-        for byte in raw:
-            self.stream[self._position] = byte
-            self._position += 1
+        size = len(raw)
+        self._fill_bytes(size)
+        self.stream[self._position:self._position + size] = raw
+        self._position += size
 
     def _write(self, fmt: str, value):
-        endianness = self.byte_order.value
-        raw = struct.pack(endianness + fmt, value)
-        self.write(raw)
+        # pack straight into the stream rather than building a bytes object
+        s = self._structs[fmt]
+        self._fill_bytes(s.size)
+        s.pack_into(self.stream, self._position, value)
+        self._position += s.size
 
     def write_bool(self, value: bool):
         self._write("?", value)
@@ -253,10 +377,7 @@ class BinaryWriter:
         self._write("H", value)
 
     def write_u24(self, value: int):
-        if self.byte_order == ByteOrder.little:
-            self.write(struct.pack("<I", value)[:3])
-        else:
-            self.write(struct.pack(">I", value)[1:])
+        self.write(value.to_bytes(3, self.byte_order.name))
 
     def write_s32(self, value: int):
         self._write("i", value)
@@ -281,6 +402,8 @@ class BinaryWriter:
 
 
 class Vec3f:
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
         self.x = x
         self.y = y
@@ -318,11 +441,20 @@ class Vec3f:
                     self.z * other.x - self.x * other.z,
                     self.x * other.y - self.y * other.x)
     
+    def mag_sq(self):
+        return self.x * self.x + self.y * self.y + self.z * self.z
+
     def mag(self):
         return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
 
     def normalized(self):
-        return self / self.mag()
+        mag_sq = self.x * self.x + self.y * self.y + self.z * self.z
+        if mag_sq == 0.0:
+            # degenerate (e.g. the normal of a zero-area triangle)
+            return Vec3f()
+
+        inv_mag = 1.0 / math.sqrt(mag_sq)
+        return Vec3f(self.x * inv_mag, self.y * inv_mag, self.z * inv_mag)
     
     @staticmethod
     def from_dict(d: dict[str, float]):
@@ -330,12 +462,21 @@ class Vec3f:
 
 
 class Triangle:
+    # __dict__ is only there to hold the cached normal
+    __slots__ = ("a", "b", "c", "__dict__")
+
     def __init__(self, a: Vec3f, b: Vec3f, c: Vec3f):
         self.a = a
         self.b = b
         self.c = c
-        self.p = (a, b, c)
-        self.normal = Vec3f.cross(self.b - self.a, self.c - self.a).normalized()
+
+    @property
+    def p(self) -> tuple[Vec3f, Vec3f, Vec3f]:
+        return (self.a, self.b, self.c)
+
+    @functools.cached_property
+    def normal(self) -> Vec3f:
+        return Vec3f.cross(self.b - self.a, self.c - self.a).normalized()
 
     def __repr__(self):
         return "Triangle({}, {}, {})".format(*self.p)
@@ -5,35 +5,66 @@ import os
 import struct
 from util import Log
 
-def decompress(src: bytes) -> bytes:
-    signature = src[:4]
+# signature and uncompressed size
+_HEADER_STRUCT = struct.Struct(">4sI")
+
+def get_uncompressed_size(src: bytes) -> int:
+    if len(src) < _HEADER_STRUCT.size:
+        Log.error("file is too small to be Yaz0 compressed")
+
+    signature, uncompressed_size = _HEADER_STRUCT.unpack_from(src)
     if signature != b'Yaz0':
         Log.error(f"file signature was {signature}, expected 'Yaz0'")
 
-    uncompressed_size, = struct.unpack(">I", src[4:8])
+    return uncompressed_size
+
+def decompress(src: bytes, out: bytearray | None = None) -> bytes | bytearray:
+    # if `out` is given, the data is decompressed into it (without a final
+    # copy) and it is returned instead of a new bytes object
+    uncompressed_size = get_uncompressed_size(src)
+
+    if out is None:
+        dst_buffer = bytearray(uncompressed_size)
+        _decompress_into(src, dst_buffer)
+        return bytes(dst_buffer)
 
-    data = src[0x10:]
+    if len(out) != uncompressed_size:
+        Log.error(f"output buffer is {len(out)} bytes, expected {uncompressed_size}")
 
-    dst_buffer = bytearray(uncompressed_size)
+    _decompress_into(src, out)
+    return out
 
-    src_idx = 0
+def _decompress_into(data: bytes, dst_buffer: bytearray):
+    src_size = len(data)
+    dst_size = len(dst_buffer)
+    # the compressed data starts right after the 0x10 byte header
+    src_idx = 0x10
     dst_idx = 0
-    code_bit_count = 0
-    code_byte = 0
-
-    while dst_idx < uncompressed_size:
-        if code_bit_count == 0:
-            code_byte = data[src_idx]
-            src_idx += 1
-            code_bit_count = 8
-        
-        if (code_byte & 0x80) != 0:
-            # straight copy
-            dst_buffer[dst_idx] = data[src_idx]
-            dst_idx += 1
-            src_idx += 1
-        
-        else:
+
+    while dst_idx < dst_size:
+        # each code byte describes the next 8 chunks, MSB first
+        code_byte = data[src_idx]
+        src_idx += 1
+
+        if code_byte == 0xff and dst_idx + 8 <= dst_size and src_idx + 8 <= src_size:
+            # 8 straight copies, done as one slice. truncated input takes the
+            # per-bit path below, which raises instead of shrinking the output
+            dst_buffer[dst_idx:dst_idx+8] = data[src_idx:src_idx+8]
+            dst_idx += 8
+            src_idx += 8
+            continue
+
+        for bit in (0x80, 0x40, 0x20, 0x10, 0x08, 0x04, 0x02, 0x01):
+            if dst_idx >= dst_size:
+                break
+
+            if code_byte & bit:
+                # straight copy
+                dst_buffer[dst_idx] = data[src_idx]
+                dst_idx += 1
+                src_idx += 1
+                continue
+
             # LZMA copy
             byte1 = data[src_idx]
             byte2 = data[src_idx + 1]
@@ -48,16 +79,27 @@ def decompress(src: bytes) -> bytes:
                 src_idx += 1
             else:
                 num_bytes += 2
-            
-            for _ in range(num_bytes):
-                dst_buffer[dst_idx] = dst_buffer[copy_idx]
-                copy_idx += 1
-                dst_idx += 1
-        
-        code_byte <<= 1
-        code_bit_count -= 1
-    
-    return bytes(dst_buffer)
+
+            end_idx = dst_idx + num_bytes
+            if end_idx > dst_size:
+                Log.error("copy runs past the end of the uncompressed data")
+            if copy_idx < 0:
+                Log.error("back-reference before the start of the uncompressed data")
+
+            if dist + 1 >= num_bytes:
+                # source and destination don't overlap
+                dst_buffer[dst_idx:end_idx] = dst_buffer[copy_idx:copy_idx+num_bytes]
+            elif dist == 0:
+                # run of a single repeated byte
+                dst_buffer[dst_idx:end_idx] = bytes((dst_buffer[copy_idx],)) * num_bytes
+            else:
+                # overlapping copy, which repeats the last dist + 1 bytes
+                # (copy_idx was checked above, so the pattern is never empty)
+                pattern = dst_buffer[copy_idx:dst_idx]
+                repeats = num_bytes // (dist + 1) + 1
+                dst_buffer[dst_idx:end_idx] = (pattern * repeats)[:num_bytes]
+
+            dst_idx = end_idx
 
 def decompress_file(filename: str) -> bytes:
     if not os.path.isfile(filename):